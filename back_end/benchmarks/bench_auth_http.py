@@ -0,0 +1,82 @@
+#back_end/benchmarks/bench_auth_http.py
+"""
+Requests/sec of the sync DRF views vs. the async-native views (users/async_views.py).
+
+Run the server under ASGI first, e.g.
+    daphne chatter_box.asgi:application -p 8000
+then
+    python benchmarks/bench_auth_http.py --base http://localhost:8000/chatterbox/v1 --seconds 10 --concurrency 32
+
+Each run signs up one throwaway account per flavour, then hammers login and /me/ with it.
+"""
+import argparse
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+FLAVOURS = {
+    'sync': {'login': 'login/', 'signup': 'signup/', 'me': 'me/'},
+    'async': {'login': 'async/login/', 'signup': 'async/signup/', 'me': 'async/me/'},
+}
+
+
+def _signup(base, paths, email, password):
+    res = requests.post(f"{base}/{paths['signup']}", data={'email': email, 'password': password, 'language': 'en'})
+    res.raise_for_status()
+    return res.json()['token']
+
+
+def _hammer(fn, seconds, concurrency):
+    """
+    Call fn() from `concurrency` threads for `seconds`; return (ok, errors, rps).
+    """
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        ok = err = 0
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            try:
+                if fn(session).status_code < 400:
+                    ok += 1
+                else:
+                    err += 1
+            except requests.RequestException:
+                err += 1
+        return ok, err
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: worker(), range(concurrency)))
+    elapsed = time.perf_counter() - start
+    ok = sum(r[0] for r in results)
+    err = sum(r[1] for r in results)
+    return ok, err, ok / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base', default='http://localhost:8000/chatterbox/v1')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    base = args.base.rstrip('/')
+    password = 'bench-' + uuid.uuid4().hex
+    print(f"{'flavour':<8} {'endpoint':<8} {'req/s':>10} {'ok':>8} {'errors':>8}")
+    for flavour, paths in FLAVOURS.items():
+        email = f"bench-{flavour}-{uuid.uuid4().hex[:8]}@example.com"
+        token = _signup(base, paths, email, password)
+        endpoints = {
+            'login': lambda s, p=paths: s.post(f"{base}/{p['login']}", json={'email': email, 'password': password}),
+            'me': lambda s, p=paths: s.get(f"{base}/{p['me']}", headers={'Authorization': f'Token {token}'}),
+        }
+        for name, fn in endpoints.items():
+            ok, err, rps = _hammer(fn, args.seconds, args.concurrency)
+            print(f"{flavour:<8} {name:<8} {rps:>10.1f} {ok:>8} {err:>8}")
+
+
+if __name__ == '__main__':
+    main()
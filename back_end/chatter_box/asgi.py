@@ -6,6 +6,7 @@ from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator, OriginValidator
 
 import chatter_box.routing
+from chatter_box import handoff, tracing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatter_box.settings')
 
@@ -22,4 +23,9 @@ application = ProtocolTypeRouter({
             ["http://localhost:5173" ]
         )
     ),
-})
\ No newline at end of file
+})
+
+# SIGUSR1 → drain this worker (see chatter_box/handoff.py)
+handoff.install_signal_handler()
+# SIGUSR2 → start/stop the sampling profiler (see chatter_box/tracing.py)
+tracing.install_signal_handler()
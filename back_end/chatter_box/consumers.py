@@ -1,68 +1,86 @@
 # back_end/chatter_box/consumers.py
 from channels.generic.websocket import AsyncWebsocketConsumer
 from urllib.parse import parse_qs
-from asgiref.sync import sync_to_async
 from collections import deque
+from django.conf import settings
+import asyncio
 import json
 import os
 import requests
+import time
 from dotenv import load_dotenv
 from googletrans import Translator
 import inspect  # ⬅️ NEW
+from . import handoff, presence, tracing
 
 load_dotenv()
 
 # Simple in-process matchmaking (single-worker friendly)
-waiting_queue = deque()  # items: {'channel': str, 'user_id': int, 'email': str, 'avatar': str, 'language': str}
+waiting_queue = deque()  # items: {'channel': str, 'user_id': int, 'email': str, 'avatar': str, 'language': str, 'enqueued_at': float, 'resume_for'?: int, 'reserved_until'?: float}
 partners = {}            # channel_name -> partner_channel_name
 user_info = {}           # channel_name -> {'user_id', 'email', 'avatar', 'language'}
 
 translator = Translator(service_urls=['translate.googleapis.com'])
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# how long a resuming user holds their queue slot for their old partner before pairing normally
+RESUME_GRACE_SECONDS = 30
 
 
 class MyWebSocketConsumer(AsyncWebsocketConsumer):
     group_name = "public_chat"
 
     async def connect(self):
+        trace = tracing.start('connect', channel=self.channel_name)
+        try:
+            await self._connect(trace)
+        finally:
+            trace.finish()
+
+    async def _connect(self, trace):
         from rest_framework.authtoken.models import Token
         from django.contrib.auth import get_user_model
-        from users.models import UserProfile, Language, UserFlag, BannedAccount
+        from users.models import UserProfile, BannedAccount
+        from users.authentication import aget_token
 
         User = get_user_model()
 
-        # parse token
-        query_string = self.scope["query_string"].decode()
-        params = parse_qs(query_string)
-        token_key = params.get("token", [None])[0]
-
+        # set before any early close(): disconnect() runs for refused handshakes too
         self.user = None
         self.avatar_url = None
         self.language = "en"
         self.partner_channel = None
+        self._queue_stats_task = None
+
+        handoff.bind_loop()
+        if handoff.draining:
+            # reject the handshake; the client retries and lands on the new worker
+            await self.close()
+            return
+
+        # parse token
+        query_string = self.scope["query_string"].decode()
+        params = parse_qs(query_string)
+        token_key = params.get("token", [None])[0]
+        resume_token = params.get("resume", [None])[0]
 
         if token_key:
             try:
-                token = await sync_to_async(Token.objects.select_related("user").get)(key=token_key)
+                # token and user from the auth cache (one query on a miss)
+                with trace.span('auth'):
+                    token = await aget_token(token_key)
                 print("This is the token: ", token)
                 self.user = token.user
 
-                # Ensure profile & language
-                def _load_profile_and_lang(u):
-                    profile, _ = UserProfile.objects.get_or_create(
-                        user=u, defaults={'avatar_url': f"https://robohash.org/{u.pk}.png?size=80x80&set=set1"}
-                    )
-                    lang, _ = Language.objects.get_or_create(user=u, defaults={'code': 'en'})
-                    UserFlag.objects.get_or_create(user=u, defaults={'count': 0})
-                    return profile.avatar_url, lang.code
-
-                self.avatar_url, self.language = await sync_to_async(_load_profile_and_lang)(self.user)
+                # Ensure profile (one row: avatar + language)
+                profile = await trace.run_sync('profile', UserProfile.objects.for_user, self.user)
+                self.avatar_url, self.language = profile.avatar_url, profile.language
 
             except Token.DoesNotExist:
                 await self.close()
                 return
 
-        await self.accept()
+        with trace.span('accept'):
+            await self.accept()
 
         # Register local info
         email = self.user.email if self.user else "Unknown"
@@ -73,8 +91,10 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
             'language': self.language,
         }
 
-        # Attempt to pair
-        await self._attempt_pair_or_wait()
+        # Attempt to pair (straight back to the old partner when resuming after a drain)
+        resume_partner = handoff.claim(resume_token, getattr(self.user, 'pk', None))
+        with trace.span('pair'):
+            await self._attempt_pair_or_wait(resume_partner=resume_partner)
 
         # Log to server console
         if self.user:
@@ -87,10 +107,19 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
             'message': 'WebSocket connection established!'
         }))
 
+        # optional periodic queue stats while waiting
+        if getattr(settings, 'PRESENCE_PUSH_INTERVAL', 0) > 0:
+            self._queue_stats_task = asyncio.create_task(self._push_queue_stats())
+
     async def disconnect(self, close_code):
+        task = getattr(self, '_queue_stats_task', None)
+        if task:
+            task.cancel()
+
         # If paired, notify partner and requeue them
+        # (not while draining: both sides are reconnecting to resume the pairing)
         partner = partners.get(self.channel_name)
-        if partner:
+        if partner and not handoff.draining:
             # notify partner
             partner_email = user_info.get(self.channel_name, {}).get('email', 'A user')
             await self.channel_layer.send(partner, {
@@ -108,7 +137,9 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
                     'email': user_info[partner]['email'],
                     'avatar': user_info[partner]['avatar'],
                     'language': user_info[partner]['language'],
+                    'enqueued_at': time.monotonic(),
                 })
+                presence.enqueued(user_info[partner]['language'])
                 await self.channel_layer.send(partner, {
                     'type': 'direct.status',
                     'status': 'waiting',
@@ -121,6 +152,7 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
         # cleanup
         user_info.pop(self.channel_name, None)
         partners.pop(self.channel_name, None)
+        presence.schedule_publish()
 
         if self.user:
             print(f"{self.user.email} has disconnected")
@@ -128,7 +160,15 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
             print("Unknown user has disconnected")
 
     async def receive(self, text_data):
-        from users.models import UserFlag, BannedAccount
+        trace = tracing.start('receive', channel=self.channel_name)
+        try:
+            await self._receive(text_data, trace)
+        finally:
+            trace.finish()
+
+    async def _receive(self, text_data, trace):
+        from users.models import UserProfile, BannedAccount
+        from users.authentication import invalidate_user
         data = json.loads(text_data)
         message = data.get('message', '')
 
@@ -138,21 +178,20 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
             return
 
         # 1) Moderation gate
-        flagged = await sync_to_async(self._moderate_text)(message)
+        flagged = await trace.run_sync('moderation', self._moderate_text, message)
         if flagged:
             # increment flags and potentially ban
             def _flag_and_maybe_ban(u):
-                flags, _ = UserFlag.objects.get_or_create(user=u, defaults={'count': 0})
-                flags.count += 1
-                flags.save()
-                banned_now = flags.count >= 3
+                count = UserProfile.objects.add_flag(u)
+                banned_now = count >= 3
                 if banned_now:
                     # ban by email, delete user
                     BannedAccount.objects.get_or_create(email=u.email)
+                    invalidate_user(u.pk)
                     u.delete()
-                return flags.count, banned_now
+                return count, banned_now
 
-            flags_count, banned_now = await sync_to_async(_flag_and_maybe_ban)(self.user)
+            flags_count, banned_now = await trace.run_sync('flag', _flag_and_maybe_ban, self.user)
 
             # warn only the flagged user
             await self.send(text_data=json.dumps({
@@ -175,23 +214,27 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
         partner_lang = user_info[partner]['language']
 
         # 🔧 translate for sender & partner (async-aware helper; no sync_to_async wrapper)
-        to_sender = await self._translate(message, sender_lang)
-        to_partner = await self._translate(message, partner_lang)
+        with trace.span('translate.sender'):
+            to_sender = await self._translate(message, sender_lang)
+        with trace.span('translate.partner'):
+            to_partner = await self._translate(message, partner_lang)
 
         # deliver to sender (left)
-        await self.send(text_data=json.dumps({
-            "author": sender_email,
-            "message": to_sender,
-            "avatar": sender_avatar
-        }))
+        with trace.span('send.self'):
+            await self.send(text_data=json.dumps({
+                "author": sender_email,
+                "message": to_sender,
+                "avatar": sender_avatar
+            }))
 
         # deliver to partner (right)
-        await self.channel_layer.send(partner, {
-            "type": "direct.message",
-            "author": sender_email,
-            "message": to_partner,
-            "avatar": sender_avatar
-        })
+        with trace.span('send.partner'):
+            await self.channel_layer.send(partner, {
+                "type": "direct.message",
+                "author": sender_email,
+                "message": to_partner,
+                "avatar": sender_avatar
+            })
 
     # === Direct handlers (no groups) ===
     async def direct_message(self, event):
@@ -213,6 +256,15 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
             payload["message"] = event["message"]
         await self.send(text_data=json.dumps(payload))
 
+    async def direct_drain(self, event):
+        # worker is shutting down: tell the client when to come back and how to resume
+        await self.send(text_data=json.dumps({
+            "status": "reconnect",
+            "retry_after_ms": event["retry_after_ms"],
+            "resume_token": event.get("resume_token"),
+        }))
+        await self.close(code=1012)  # 1012 = service restart
+
     # === Helpers ===
     def _remove_from_waiting(self, channel_name):
         if not waiting_queue:
@@ -222,23 +274,39 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
             itm = waiting_queue.popleft()
             if itm['channel'] != channel_name:
                 keep.append(itm)
+            else:
+                presence.dequeued(itm['language'])
         waiting_queue.extend(keep)
 
-    async def _attempt_pair_or_wait(self):
+    async def _attempt_pair_or_wait(self, resume_partner=None):
+        my_id = user_info[self.channel_name]['user_id']
+        now = time.monotonic()
+
         # try to find a partner not myself
         partner_item = None
-        for _ in range(len(waiting_queue)):
-            cand = waiting_queue.popleft()
-            if cand['channel'] != self.channel_name:
-                partner_item = cand
-                break
-            waiting_queue.append(cand)
+        if resume_partner is not None:
+            # resuming: only my old partner will do (they may not be back yet)
+            for cand in waiting_queue:
+                if cand['user_id'] == resume_partner and cand.get('resume_for') in (None, my_id):
+                    partner_item = cand
+                    break
+            if partner_item:
+                waiting_queue.remove(partner_item)
+        else:
+            for _ in range(len(waiting_queue)):
+                cand = waiting_queue.popleft()
+                reserved = cand.get('resume_for') not in (None, my_id) and cand.get('reserved_until', 0) > now
+                if cand['channel'] != self.channel_name and not reserved:
+                    partner_item = cand
+                    break
+                waiting_queue.append(cand)
 
         if partner_item:
             # pair them
             partners[self.channel_name] = partner_item['channel']
             partners[partner_item['channel']] = self.channel_name
             self.partner_channel = partner_item['channel']
+            presence.dequeued(partner_item['language'], waited=now - partner_item['enqueued_at'])
 
             # update statuses
             await self.send(text_data=json.dumps({"status": "paired"}))
@@ -258,19 +326,42 @@ class MyWebSocketConsumer(AsyncWebsocketConsumer):
                 'author': 'System',
                 'message': f"You are now chatting with {their_email}."
             }))
+            presence.schedule_publish()
         else:
             # no partner → wait
-            waiting_queue.append({
+            item = {
                 'channel': self.channel_name,
-                'user_id': user_info[self.channel_name]['user_id'],
+                'user_id': my_id,
                 'email': user_info[self.channel_name]['email'],
                 'avatar': user_info[self.channel_name]['avatar'],
                 'language': user_info[self.channel_name]['language'],
-            })
+                'enqueued_at': now,
+            }
+            if resume_partner is not None:
+                # hold this slot for the old partner for a while
+                item['resume_for'] = resume_partner
+                item['reserved_until'] = now + RESUME_GRACE_SECONDS
+            waiting_queue.append(item)
+            presence.enqueued(item['language'])
             await self.send(text_data=json.dumps({
                 'status': 'waiting',
                 'message': 'Searching for a chat partner...'
             }))
+            presence.schedule_publish()
+
+    async def _push_queue_stats(self):
+        # no 'status' key: the client must not treat this as a waiting/paired transition
+        interval = settings.PRESENCE_PUSH_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            if self.channel_name in partners:
+                continue
+            try:
+                stats = await presence.astats()
+            except Exception as e:
+                print(f"queue stats unavailable: {e!r}")
+                continue
+            await self.send(text_data=json.dumps({'queue': stats}))
 
     def _moderate_text(self, text: str) -> bool:
         """
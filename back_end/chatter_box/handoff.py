@@ -0,0 +1,175 @@
+#back_end/chatter_box/handoff.py
+"""
+Graceful drain + pairing handoff for zero-downtime restarts.
+
+Deploy flow:
+  1. `python manage.py drain_worker <pid>` (or `kill -USR1 <pid>`) on the old worker.
+  2. The worker stops accepting sockets, snapshots who is paired with whom to
+     HANDOFF_STATE_DIR/handoff-<pid>.json, and tells every client to reconnect
+     after a jittered delay, handing paired users a one-time resume token.
+  3. Any worker that sees an unknown `?resume=<token>` re-reads the snapshot files
+     that changed since it last looked (new workers are usually already running when
+     the old one drains), and matches the client straight to its old partner instead
+     of going through the normal waiting queue.
+"""
+import asyncio
+import glob
+import json
+import os
+import random
+import secrets
+import signal
+import time
+
+from django.conf import settings
+
+draining = False
+resumes = {}        # resume_token -> {'user_id', 'partner_id', 'expires'}
+
+_loop = None
+_seen_mtimes = {}   # snapshot path -> mtime already loaded
+_claimed = set()    # tokens redeemed here; a re-read file must not bring them back
+
+
+def _state_dir():
+    return getattr(settings, 'HANDOFF_STATE_DIR', os.path.join(settings.BASE_DIR, 'handoff'))
+
+
+def _state_path():
+    return os.path.join(_state_dir(), f"handoff-{os.getpid()}.json")
+
+
+def _resume_ttl():
+    return getattr(settings, 'HANDOFF_RESUME_TTL', 120)
+
+
+def reconnect_delay_ms():
+    """
+    Jittered backoff so drained clients don't all hit the new worker at once.
+    """
+    low = getattr(settings, 'HANDOFF_RECONNECT_MIN_MS', 500)
+    high = getattr(settings, 'HANDOFF_RECONNECT_MAX_MS', 5000)
+    return random.randint(low, max(low, high))
+
+
+def bind_loop():
+    """
+    Remember the running event loop so the signal handler can schedule the drain on it.
+    """
+    global _loop
+    if _loop is None:
+        _loop = asyncio.get_running_loop()
+
+
+def snapshot(partners, user_info):
+    """
+    Write every live pairing to disk and return {channel_name: resume_token}.
+    Anonymous users can't be re-identified on reconnect, so they get no token.
+    """
+    expires = time.time() + _resume_ttl()
+    tokens = {}
+    state = {}
+    for channel, partner in partners.items():
+        me = user_info.get(channel, {}).get('user_id')
+        them = user_info.get(partner, {}).get('user_id')
+        if me is None or them is None:
+            continue
+        token = secrets.token_urlsafe(24)
+        tokens[channel] = token
+        state[token] = {'user_id': me, 'partner_id': them, 'expires': expires}
+
+    os.makedirs(_state_dir(), exist_ok=True)
+    path = _state_path()
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as fh:
+        json.dump(state, fh)
+    os.replace(tmp, path)
+    return tokens
+
+
+def restore():
+    """
+    Load resume tokens from every worker's snapshot file that is new or changed since
+    the last call. Expired entries are dropped, and fully expired files are removed.
+    """
+    now = time.time()
+    for path in glob.glob(os.path.join(_state_dir(), 'handoff-*.json')):
+        try:
+            mtime = os.path.getmtime(path)
+            if _seen_mtimes.get(path) == mtime:
+                continue
+            with open(path) as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        _seen_mtimes[path] = mtime
+        live = {t: e for t, e in state.items() if e.get('expires', 0) > now and t not in _claimed}
+        resumes.update(live)
+        if not any(e.get('expires', 0) > now for e in state.values()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            _seen_mtimes.pop(path, None)
+
+
+def claim(token, user_id):
+    """
+    Redeem a resume token for `user_id`. Returns the old partner's user id, or None.
+    Tokens are single use.
+    """
+    if not token or user_id is None:
+        return None
+    if token not in resumes:
+        # the draining worker may have written its snapshot after we last looked
+        restore()
+    entry = resumes.pop(token, None)
+    if entry:
+        _claimed.add(token)
+    if not entry or entry['user_id'] != user_id or entry['expires'] <= time.time():
+        return None
+    return entry['partner_id']
+
+
+async def drain():
+    """
+    Snapshot pairings and send every local socket a reconnect hint.
+    """
+    from channels.layers import get_channel_layer
+    from . import consumers
+
+    channel_layer = get_channel_layer()
+    try:
+        tokens = snapshot(consumers.partners, consumers.user_info)
+    except OSError as e:
+        print(f"handoff snapshot failed: {e!r}")
+        tokens = {}
+
+    for channel in list(consumers.user_info):
+        await channel_layer.send(channel, {
+            'type': 'direct.drain',
+            'retry_after_ms': reconnect_delay_ms(),
+            'resume_token': tokens.get(channel),
+        })
+    print(f"drain: notified {len(consumers.user_info)} sockets, {len(tokens)} resumable")
+
+
+def start_drain(*_):
+    """
+    Signal handler: flip into drain mode and run `drain()` on the worker's loop.
+    """
+    global draining
+    if draining:
+        return
+    draining = True
+    print("drain requested: refusing new connections")
+    if _loop is not None:
+        _loop.call_soon_threadsafe(lambda: _loop.create_task(drain()))
+
+
+def install_signal_handler(signum=signal.SIGUSR1):
+    try:
+        signal.signal(signum, start_drain)
+    except ValueError:
+        # not on the main thread (e.g. under some test runners); drain stays manual
+        pass
@@ -0,0 +1,186 @@
+#back_end/chatter_box/presence.py
+"""
+Queue / presence statistics without scanning waiting_queue or partners.
+
+The consumer calls enqueued()/dequeued() wherever it adds or removes waiting users, so
+per-language waiting counts and an EWMA of actual wait times are kept incrementally;
+totals come from len() of the matchmaking structures. After a change the consumer calls
+schedule_publish(), which writes this worker's numbers to the Django cache in a
+background task: immediately if the last write is older than PRESENCE_PUBLISH_INTERVAL,
+otherwise once the interval is up (so the last change in a burst is never lost).
+While the worker has any sockets, a heartbeat republishes every PRESENCE_TTL/3 so a
+worker whose users just sit in their chats doesn't expire out of the totals.
+stats() sums every live worker's entry. Point CACHES at a shared backend (Redis/Memcached)
+for cross-worker totals; with the default local-memory cache each worker reports itself.
+"""
+import asyncio
+import os
+import socket
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+_REGISTRY_KEY = 'presence:workers'
+_EWMA_ALPHA = 0.2
+
+waiting_by_language = Counter()   # language -> users waiting on this worker
+wait_ewma = {}                    # language -> smoothed seconds from enqueue to pairing
+
+_last_publish = 0.0
+_pending = None                   # scheduled publish task, if any
+_heartbeat = None                 # periodic republish task while sockets are open
+_memo = (0.0, None)               # (computed_at, stats)
+
+
+def _worker_key(worker_id):
+    return f"presence:{worker_id}"
+
+
+def _ttl():
+    return getattr(settings, 'PRESENCE_TTL', 300)
+
+
+def enqueued(language):
+    waiting_by_language[language] += 1
+
+
+def dequeued(language, waited=None):
+    """
+    A waiting user left the queue; `waited` (seconds) is given when they got paired.
+    """
+    waiting_by_language[language] -= 1
+    if waiting_by_language[language] <= 0:
+        del waiting_by_language[language]
+    if waited is not None:
+        prev = wait_ewma.get(language)
+        wait_ewma[language] = waited if prev is None else prev + _EWMA_ALPHA * (waited - prev)
+
+
+def local_snapshot():
+    from . import consumers
+    return {
+        'waiting': len(consumers.waiting_queue),
+        'paired': len(consumers.partners),
+        'waiting_by_language': dict(waiting_by_language),
+        'wait_ewma': dict(wait_ewma),
+    }
+
+
+def _interval():
+    return getattr(settings, 'PRESENCE_PUBLISH_INTERVAL', 1.0)
+
+
+def schedule_publish():
+    """
+    Publish this worker's snapshot soon, without blocking or raising in the caller.
+    At most one publish is pending; it snapshots state when it runs, so it covers
+    every change made while it waited.
+    """
+    global _pending
+    _ensure_heartbeat()
+    if _pending is not None and not _pending.done():
+        return
+    delay = max(0.0, _interval() - (time.monotonic() - _last_publish))
+    _pending = asyncio.get_running_loop().create_task(_publish_later(delay))
+
+
+def _ensure_heartbeat():
+    global _heartbeat
+    from . import consumers
+    if consumers.user_info and (_heartbeat is None or _heartbeat.done()):
+        _heartbeat = asyncio.get_running_loop().create_task(_heartbeat_loop())
+
+
+async def _heartbeat_loop():
+    """
+    Refresh this worker's entry well inside PRESENCE_TTL until its last socket goes.
+    """
+    from . import consumers
+    while consumers.user_info:
+        await asyncio.sleep(_ttl() / 3)
+        schedule_publish()
+
+
+async def _publish_later(delay):
+    if delay:
+        await asyncio.sleep(delay)
+    try:
+        await publish()
+    except Exception as e:
+        # stats are best effort; a cache outage must not break matchmaking
+        print(f"presence publish failed: {e!r}")
+
+
+async def publish():
+    """
+    Write this worker's snapshot to the shared cache and make sure it is registered.
+    """
+    global _last_publish
+    _last_publish = time.monotonic()
+    await cache.aset(_worker_key(WORKER_ID), local_snapshot(), _ttl())
+    workers = await cache.aget(_REGISTRY_KEY) or []
+    if WORKER_ID not in workers:
+        # racy read-modify-write, but every publish re-adds a worker that got clobbered;
+        # also drop workers whose snapshot has expired (restarted / gone)
+        alive = await cache.aget_many([_worker_key(w) for w in workers])
+        workers = [w for w in workers if _worker_key(w) in alive]
+        await cache.aset(_REGISTRY_KEY, workers + [WORKER_ID], None)
+
+
+def _merge(snapshots):
+    snapshots[_worker_key(WORKER_ID)] = local_snapshot()  # always fresh for this worker
+    waiting = paired = 0
+    by_language = Counter()
+    weighted_wait = Counter()
+    weights = Counter()
+    for snap in snapshots.values():
+        waiting += snap['waiting']
+        paired += snap['paired']
+        by_language.update(snap['waiting_by_language'])
+        for lang, seconds in snap['wait_ewma'].items():
+            # weight each worker's estimate by how many are waiting there (at least 1)
+            w = max(snap['waiting_by_language'].get(lang, 0), 1)
+            weighted_wait[lang] += seconds * w
+            weights[lang] += w
+    return {
+        'workers': len(snapshots),
+        'waiting': waiting,
+        'paired': paired,
+        'waiting_by_language': dict(by_language),
+        'expected_wait_seconds': {lang: round(weighted_wait[lang] / weights[lang], 1) for lang in weights},
+    }
+
+
+def _memoized():
+    computed_at, result = _memo
+    if result is not None and time.monotonic() - computed_at < _interval():
+        return result
+    return None
+
+
+def _remember(result):
+    global _memo
+    _memo = (time.monotonic(), result)
+    return result
+
+
+def stats():
+    """
+    Aggregated stats across workers (sync, for DRF views). Memoized for one publish interval.
+    """
+    result = _memoized()
+    if result is None:
+        workers = cache.get(_REGISTRY_KEY) or []
+        result = _remember(_merge(cache.get_many([_worker_key(w) for w in workers])))
+    return result
+
+
+async def astats():
+    result = _memoized()
+    if result is None:
+        workers = await cache.aget(_REGISTRY_KEY) or []
+        result = _remember(_merge(await cache.aget_many([_worker_key(w) for w in workers])))
+    return result
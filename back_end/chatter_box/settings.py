@@ -91,10 +91,31 @@ DATABASES = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ]
 }
 
+# In-process token cache shared by REST and WebSocket auth (users/authentication.py).
+# Caches Token+User only (~1 KB per entry). Log_out/ban invalidation is local to the
+# worker that handled it: on other workers a revoked token keeps working for up to
+# TOKEN_CACHE_TTL seconds, so keep it short.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '10'))   # seconds
+
+# Threads used by users/async_views.py for password hashing (bounded so it can't starve the loop)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '4'))
+
+# Avatar uploads (users/avatars.py): the capped handler runs first so oversized files are dropped mid-stream
+FILE_UPLOAD_HANDLERS = [
+    'users.avatars.CappedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+AVATAR_MAX_BYTES = int(os.getenv('AVATAR_MAX_BYTES', str(5 * 1024 * 1024)))
+AVATAR_SIZE = int(os.getenv('AVATAR_SIZE', '128'))              # stored avatars are AVATAR_SIZE x AVATAR_SIZE PNGs
+AVATAR_MAX_PIXELS = int(os.getenv('AVATAR_MAX_PIXELS', '40000000'))  # larger images are rejected before decoding
+AVATAR_WORKERS = int(os.getenv('AVATAR_WORKERS', '2'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -142,4 +163,36 @@ STATIC_ROOT = '/var/www/myapp/static'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
\ No newline at end of file
+CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+# Graceful drain / pairing handoff between worker restarts (chatter_box/handoff.py)
+HANDOFF_STATE_DIR = os.getenv('HANDOFF_STATE_DIR', str(BASE_DIR / 'handoff'))   # one snapshot file per worker; shared by all workers on a host
+HANDOFF_RESUME_TTL = int(os.getenv('HANDOFF_RESUME_TTL', '120'))          # seconds a resume token stays valid
+HANDOFF_RECONNECT_MIN_MS = int(os.getenv('HANDOFF_RECONNECT_MIN_MS', '500'))
+HANDOFF_RECONNECT_MAX_MS = int(os.getenv('HANDOFF_RECONNECT_MAX_MS', '5000'))
+
+# Consumer tracing / profiling (chatter_box/tracing.py)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))   # fraction of connect/receive calls traced; 0 = off
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '250'))         # traced ops slower than this are logged
+TRACE_SLOW_LOG = os.getenv('TRACE_SLOW_LOG')                     # file for the slow-op log; console if unset
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR')             # defaults to the system temp dir
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_ops': (
+            {'class': 'logging.FileHandler', 'filename': TRACE_SLOW_LOG}
+            if TRACE_SLOW_LOG else {'class': 'logging.StreamHandler'}
+        ),
+    },
+    'loggers': {
+        'chatter_box.slow': {'handlers': ['slow_ops'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Queue / presence stats (chatter_box/presence.py); use a shared CACHES backend to aggregate across workers
+PRESENCE_PUBLISH_INTERVAL = float(os.getenv('PRESENCE_PUBLISH_INTERVAL', '1'))  # seconds between cache writes per worker
+PRESENCE_TTL = int(os.getenv('PRESENCE_TTL', '300'))                            # a dead worker drops out after this; live ones republish every TTL/3
+PRESENCE_PUSH_INTERVAL = float(os.getenv('PRESENCE_PUSH_INTERVAL', '0'))        # >0: push {'queue': stats} to waiting sockets
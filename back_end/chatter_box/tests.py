@@ -0,0 +1,267 @@
+#back_end/chatter_box/tests.py
+import asyncio
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from . import consumers, handoff, presence, tracing
+
+
+class HandoffTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(HANDOFF_STATE_DIR=self.tmp.name, HANDOFF_RESUME_TTL=60)
+        override.enable()
+        self.addCleanup(override.disable)
+        for state in (handoff.resumes, handoff._seen_mtimes, handoff._claimed):
+            state.clear()
+
+    def _write_worker_file(self, pid, state):
+        with open(os.path.join(self.tmp.name, f"handoff-{pid}.json"), 'w') as fh:
+            json.dump(state, fh)
+
+    def test_snapshot_and_claim_round_trip(self):
+        partners = {'a': 'b', 'b': 'a'}
+        user_info = {'a': {'user_id': 1}, 'b': {'user_id': 2}}
+        tokens = handoff.snapshot(partners, user_info)
+        handoff.resumes.clear()
+        handoff._seen_mtimes.clear()
+
+        self.assertEqual(handoff.claim(tokens['a'], 1), 2)
+        self.assertEqual(handoff.claim(tokens['b'], 2), 1)
+        # single use
+        self.assertIsNone(handoff.claim(tokens['a'], 1))
+
+    def test_claim_rejects_other_user(self):
+        tokens = handoff.snapshot({'a': 'b', 'b': 'a'}, {'a': {'user_id': 1}, 'b': {'user_id': 2}})
+        self.assertIsNone(handoff.claim(tokens['a'], 99))
+
+    def test_anonymous_pairs_get_no_token(self):
+        tokens = handoff.snapshot({'a': 'b', 'b': 'a'}, {'a': {'user_id': None}, 'b': {'user_id': 2}})
+        self.assertEqual(tokens, {})
+
+    def test_snapshot_written_after_first_lookup_is_picked_up(self):
+        # the new worker is already serving (and has looked for snapshots) before the old one drains
+        self.assertIsNone(handoff.claim('unknown', 1))
+        self._write_worker_file(4242, {'late': {'user_id': 1, 'partner_id': 2, 'expires': time.time() + 60}})
+        self.assertEqual(handoff.claim('late', 1), 2)
+
+    def test_snapshots_from_several_workers_are_merged(self):
+        expires = time.time() + 60
+        self._write_worker_file(1, {'t1': {'user_id': 1, 'partner_id': 2, 'expires': expires}})
+        self._write_worker_file(2, {'t2': {'user_id': 3, 'partner_id': 4, 'expires': expires}})
+        self.assertEqual(handoff.claim('t1', 1), 2)
+        self.assertEqual(handoff.claim('t2', 3), 4)
+
+    def test_expired_tokens_are_ignored(self):
+        self._write_worker_file(1, {'old': {'user_id': 1, 'partner_id': 2, 'expires': time.time() - 1}})
+        self.assertIsNone(handoff.claim('old', 1))
+
+
+class DrainRefusalTests(SimpleTestCase):
+
+    async def test_connect_refused_while_draining(self):
+        with mock.patch.object(handoff, 'draining', True), \
+                mock.patch.object(handoff, '_loop', None), \
+                mock.patch.object(presence, 'schedule_publish'):
+            communicator = WebsocketCommunicator(consumers.MyWebSocketConsumer.as_asgi(), '/ws/chat/')
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+            # the server still runs disconnect() for the refused socket; it must not raise
+            await communicator.disconnect()
+
+
+def _consumer(channel, user_id):
+    c = consumers.MyWebSocketConsumer()
+    c.channel_name = channel
+    c.send = mock.AsyncMock()
+    c.channel_layer = mock.Mock(send=mock.AsyncMock())
+    consumers.user_info[channel] = {'user_id': user_id, 'email': f"{channel}@x.io", 'avatar': None, 'language': 'en'}
+    return c
+
+
+class ReservedSlotPairingTests(SimpleTestCase):
+
+    def setUp(self):
+        for state in (consumers.waiting_queue, consumers.partners, consumers.user_info):
+            self.addCleanup(state.clear)
+        # stats publishing is covered separately; don't leave tasks on the test's loop
+        patcher = mock.patch.object(presence, 'schedule_publish')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_reserved_slot_is_kept_for_old_partner(self):
+        a = _consumer('a', 1)
+        # user 1 came back first and holds its slot for user 2
+        await a._attempt_pair_or_wait(resume_partner=2)
+        self.assertEqual(consumers.waiting_queue[0]['resume_for'], 2)
+
+        # a stranger doesn't get the reserved slot
+        c = _consumer('c', 3)
+        await c._attempt_pair_or_wait()
+        self.assertNotIn('c', consumers.partners)
+        self.assertEqual([i['channel'] for i in consumers.waiting_queue], ['a', 'c'])
+
+        # the old partner resumes straight into it
+        b = _consumer('b', 2)
+        await b._attempt_pair_or_wait(resume_partner=1)
+        self.assertEqual(consumers.partners['b'], 'a')
+        self.assertEqual(consumers.partners['a'], 'b')
+        self.assertEqual([i['channel'] for i in consumers.waiting_queue], ['c'])
+
+    async def test_expired_reservation_pairs_normally(self):
+        a = _consumer('a', 1)
+        await a._attempt_pair_or_wait(resume_partner=2)
+        consumers.waiting_queue[0]['reserved_until'] = time.monotonic() - 1
+
+        c = _consumer('c', 3)
+        await c._attempt_pair_or_wait()
+        self.assertEqual(consumers.partners['c'], 'a')
+
+
+class PresenceCounterTests(SimpleTestCase):
+
+    def setUp(self):
+        presence.waiting_by_language.clear()
+        presence.wait_ewma.clear()
+        self.addCleanup(presence.waiting_by_language.clear)
+        self.addCleanup(presence.wait_ewma.clear)
+
+    def test_enqueue_dequeue_and_wait_ewma(self):
+        presence.enqueued('en')
+        presence.enqueued('en')
+        presence.enqueued('fr')
+        presence.dequeued('en', waited=10)
+        presence.dequeued('fr')          # left without being paired: no wait sample
+
+        self.assertEqual(dict(presence.waiting_by_language), {'en': 1})
+        self.assertEqual(presence.wait_ewma, {'en': 10})
+
+        presence.enqueued('en')
+        presence.dequeued('en', waited=20)
+        self.assertAlmostEqual(presence.wait_ewma['en'], 12.0)   # 10 + 0.2 * (20 - 10)
+
+    def test_merge_sums_workers(self):
+        mine = {'waiting': 1, 'paired': 2, 'waiting_by_language': {'en': 1}, 'wait_ewma': {'en': 4.0}}
+        other = {'waiting': 3, 'paired': 4, 'waiting_by_language': {'en': 3}, 'wait_ewma': {'en': 8.0}}
+        with mock.patch.object(presence, 'local_snapshot', return_value=mine):
+            result = presence._merge({'presence:other:1': other})
+
+        self.assertEqual(result['workers'], 2)
+        self.assertEqual((result['waiting'], result['paired']), (4, 6))
+        self.assertEqual(result['waiting_by_language'], {'en': 4})
+        self.assertEqual(result['expected_wait_seconds'], {'en': 7.0})   # (4*1 + 8*3) / 4
+
+
+@override_settings(PRESENCE_PUBLISH_INTERVAL=0.05)
+class PresencePublishTests(SimpleTestCase):
+
+    def setUp(self):
+        for state in (consumers.waiting_queue, consumers.partners, presence.waiting_by_language):
+            state.clear()
+            self.addCleanup(state.clear)
+        presence._pending = None
+        presence._heartbeat = None
+        presence._last_publish = 0.0
+
+    async def _published(self):
+        return await presence.cache.aget(presence._worker_key(presence.WORKER_ID))
+
+    async def test_change_inside_interval_is_flushed_later(self):
+        presence.schedule_publish()
+        await asyncio.sleep(0.01)
+        self.assertEqual((await self._published())['waiting_by_language'], {})
+
+        # inside the interval: deferred, not dropped
+        presence.enqueued('en')
+        presence.schedule_publish()
+        presence.enqueued('fr')
+        presence.schedule_publish()
+        self.assertEqual((await self._published())['waiting_by_language'], {})
+
+        await asyncio.sleep(0.1)
+        self.assertEqual((await self._published())['waiting_by_language'], {'en': 1, 'fr': 1})
+
+    async def test_cache_errors_are_swallowed(self):
+        with mock.patch.object(presence.cache, 'aset', side_effect=ConnectionError('down')):
+            presence.schedule_publish()
+            await presence._pending     # completes without raising
+
+    @override_settings(PRESENCE_TTL=0.15)
+    async def test_heartbeat_keeps_idle_worker_registered(self):
+        consumers.user_info['a'] = {'user_id': 1}
+        self.addCleanup(consumers.user_info.clear)
+        presence.schedule_publish()
+        await asyncio.sleep(0.01)
+        self.assertIsNotNone(await self._published())
+
+        # no connects or disconnects for longer than the TTL
+        await asyncio.sleep(0.3)
+        self.assertIsNotNone(await self._published())
+
+        # once the last socket is gone the heartbeat stops
+        consumers.user_info.clear()
+        await asyncio.sleep(0.1)
+        self.assertTrue(presence._heartbeat.done())
+
+
+class TracingTests(SimpleTestCase):
+
+    @override_settings(TRACE_SAMPLE_RATE=0)
+    def test_start_disabled_returns_null_trace(self):
+        self.assertIs(tracing.start('receive'), tracing.NULL_TRACE)
+
+    @override_settings(TRACE_SAMPLE_RATE=1)
+    def test_start_fully_sampled_returns_trace(self):
+        trace = tracing.start('receive', channel='c1')
+        self.assertIsInstance(trace, tracing.Trace)
+        self.assertEqual(trace.tags, {'channel': 'c1'})
+
+    @override_settings(TRACE_SLOW_MS=0)
+    def test_slow_operation_is_logged(self):
+        trace = tracing.Trace('receive', channel='c1')
+        with trace.span('translate'):
+            pass
+        with self.assertLogs('chatter_box.slow', level='WARNING') as logs:
+            trace.finish()
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['op'], entry['channel']), ('receive', 'c1'))
+        self.assertIn('translate', entry['spans'])
+
+    @override_settings(TRACE_SLOW_MS=60_000)
+    def test_fast_operation_is_not_logged(self):
+        with self.assertNoLogs('chatter_box.slow'):
+            tracing.Trace('receive').finish()
+
+    async def test_run_sync_records_span_and_wait(self):
+        trace = tracing.Trace('connect')
+        self.assertEqual(await trace.run_sync('profile', lambda x: x * 2, 21), 42)
+        self.assertEqual([name for name, _ in trace.spans], ['profile', 'profile.wait'])
+        self.assertTrue(all(seconds >= 0 for _, seconds in trace.spans))
+
+
+class ProfilerToggleTests(SimpleTestCase):
+
+    def test_second_toggle_writes_folded_stacks(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with override_settings(PROFILE_OUTPUT_DIR=tmp.name, PROFILE_INTERVAL_MS=1):
+            tracing.toggle_profiler()
+            profiler = tracing._profiler
+            self.addCleanup(setattr, tracing, '_profiler', None)
+            time.sleep(0.05)
+            tracing.toggle_profiler()
+            profiler.join(timeout=5)
+
+        self.assertIsNone(tracing._profiler)
+        dumps = [f for f in os.listdir(tmp.name) if f.endswith('.folded')]
+        self.assertEqual(len(dumps), 1)
+        with open(os.path.join(tmp.name, dumps[0])) as fh:
+            self.assertTrue(fh.read().strip())
@@ -0,0 +1,161 @@
+#back_end/chatter_box/tracing.py
+"""
+Opt-in latency tracing for the chat consumer, plus an on-demand sampling profiler.
+
+Tracing: `tracing.start('receive')` returns a Trace for a sampled fraction of operations
+(TRACE_SAMPLE_RATE, 0 = off). Each stage is wrapped in `trace.span(name)`, and blocking
+calls go through `trace.run_sync(name, fn)`, which also records `<name>.wait`, the time
+spent queued for a sync_to_async thread before `fn` started. Operations slower than
+TRACE_SLOW_MS are written to the `chatter_box.slow` logger as one JSON line.
+
+Profiling: SIGUSR2 (`python manage.py profile_worker <pid>`) starts a sampling
+profiler thread in a live worker; the next SIGUSR2 stops it and writes collapsed
+stacks (flamegraph.pl / speedscope format) to PROFILE_OUTPUT_DIR.
+"""
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+slow_log = logging.getLogger('chatter_box.slow')
+
+
+class Trace:
+
+    def __init__(self, op, **tags):
+        self.op = op
+        self.tags = tags
+        self.spans = []          # (name, seconds)
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, time.perf_counter() - t0))
+
+    async def run_sync(self, name, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+        started = None
+
+        def _call():
+            nonlocal started
+            started = time.perf_counter()
+            return fn(*args, **kwargs)
+
+        with self.span(name):
+            result = await sync_to_async(_call)()
+        self.spans.append((f"{name}.wait", started - submitted))
+        return result
+
+    def finish(self):
+        total_ms = (time.perf_counter() - self._start) * 1000
+        if total_ms < getattr(settings, 'TRACE_SLOW_MS', 250):
+            return
+        slow_log.warning(json.dumps({
+            'op': self.op,
+            'total_ms': round(total_ms, 2),
+            'spans': {name: round(sec * 1000, 2) for name, sec in self.spans},
+            **self.tags,
+        }))
+
+
+class _NullTrace:
+    """
+    What unsampled operations get: same interface, no bookkeeping.
+    """
+
+    def span(self, name):
+        return nullcontext()
+
+    async def run_sync(self, name, fn, *args, **kwargs):
+        return await sync_to_async(fn)(*args, **kwargs)
+
+    def finish(self):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+def start(op, **tags):
+    rate = getattr(settings, 'TRACE_SAMPLE_RATE', 0.0)
+    if rate <= 0 or random.random() >= rate:
+        return NULL_TRACE
+    return Trace(op, **tags)
+
+
+# === Sampling profiler ===
+
+_profiler = None
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Samples every thread's Python stack at a fixed interval; writes collapsed stacks on stop.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='sampling-profiler', daemon=True)
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+        self._dump()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _dump(self):
+        out_dir = getattr(settings, 'PROFILE_OUTPUT_DIR', None) or tempfile.gettempdir()
+        path = os.path.join(out_dir, f"profile-{os.getpid()}-{int(time.time())}.folded")
+        with open(path, 'w') as fh:
+            for stack, count in self.samples.most_common():
+                fh.write(f"{stack} {count}\n")
+        print(f"profiler: {sum(self.samples.values())} samples written to {path}")
+
+
+def toggle_profiler(*_):
+    """
+    Signal handler: start the sampling profiler, or stop it and dump the results.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(getattr(settings, 'PROFILE_INTERVAL_MS', 10) / 1000)
+        _profiler.start()
+        print(f"profiler: started in pid {os.getpid()}")
+    else:
+        _profiler.stop()
+        _profiler = None
+
+
+def install_signal_handler(signum=signal.SIGUSR2):
+    try:
+        signal.signal(signum, toggle_profiler)
+    except ValueError:
+        # not on the main thread; profiling stays unavailable
+        pass
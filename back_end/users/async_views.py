@@ -0,0 +1,177 @@
+#back_end/users/async_views.py
+"""
+Async-native versions of Log_in, Sign_up and Me for serving under ASGI.
+
+DRF's APIView is sync-only, so these are plain Django async views that speak the
+same JSON and `Authorization: Token <key>` protocol as users/views.py. DB work goes
+through the async ORM (or one sync_to_async hop for transactions), and password
+hashing (including the whole authenticate() call for login) runs in a small bounded
+thread pool so it never blocks the event loop.
+"""
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, close_old_connections, transaction
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+
+from .authentication import aget_token
+from .avatars import AvatarError, aavatar_data_url
+from .models import UserProfile, BannedAccount, _default_avatar
+
+User = get_user_model()
+
+# PBKDF2 releases the GIL, so a few threads give real parallelism; the bound keeps a
+# signup burst from starving the default executor that sync_to_async relies on.
+_hash_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PASSWORD_HASH_WORKERS', 4),
+    thread_name_prefix='pwhash',
+)
+
+
+async def _run_hasher(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, functools.partial(fn, *args, **kwargs))
+
+
+def _authenticate(request, email, password):
+    """
+    authenticate() as Log_in calls it (backends, user_login_failed, hash upgrades), run on
+    a hash-pool thread; that thread's DB connection is tidied up like a request's would be.
+    """
+    try:
+        return authenticate(request, username=email, password=password)
+    finally:
+        close_old_connections()
+
+
+def _request_data(request):
+    """
+    Form/multipart fields, or a JSON body (what axios sends for login).
+    """
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+async def _token_user(request):
+    """
+    Resolve `Authorization: Token <key>` to a user, or None.
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    try:
+        token = await aget_token(auth[1])
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def _create_account(email, password_hash, language_code, avatar_url):
+    with transaction.atomic():
+        user = User.objects.create(
+            username=User.normalize_username(email),
+            email=User.objects.normalize_email(email),
+            password=password_hash,
+        )
+        token = Token.objects.create(user=user)
+        UserProfile.objects.create(user=user, avatar_url=avatar_url or _default_avatar(user), language=language_code)
+    return user, token
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class Log_in_async(View):
+
+    async def post(self, request):
+        data = _request_data(request)
+        email = data.get('email')
+        password = data.get('password')
+
+        user = await _run_hasher(_authenticate, request, email, password)
+        if not user:
+            return JsonResponse({'detail': 'Invalid credentials'}, status=400)
+
+        token, _ = await Token.objects.aget_or_create(user=user)
+        await sync_to_async(UserProfile.objects.ensure)(user)
+
+        return JsonResponse({'client': user.email, 'token': token.key})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class Sign_up_async(View):
+
+    async def post(self, request):
+        data = _request_data(request)
+        email = data.get('email')
+        password = data.get('password')
+        language_code = (data.get('language') or 'en').lower()
+
+        ip = request.META.get('REMOTE_ADDR')
+        print(f'User with ip:{ip} has sign up')
+
+        if await BannedAccount.objects.filter(email__iexact=email).aexists():
+            return JsonResponse({'detail': 'This email is banned.'}, status=403)
+
+        try:
+            avatar_url = await aavatar_data_url(request) or data.get('avatar_url')
+        except AvatarError as e:
+            return JsonResponse({'detail': str(e)}, status=e.status_code)
+
+        password_hash = await _run_hasher(make_password, password)
+        try:
+            user, token = await sync_to_async(_create_account)(email, password_hash, language_code, avatar_url)
+        except IntegrityError:
+            return JsonResponse({'detail': 'An account with this email already exists.'}, status=400)
+
+        return JsonResponse({'client': user.email, 'token': token.key}, status=201)
+
+    async def put(self, request):
+        return await self.post(request)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class Me_async(View):
+
+    async def get(self, request):
+        user = await _token_user(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        profile, _ = await UserProfile.objects.aget_or_create(
+            user_id=user.pk, defaults={'avatar_url': _default_avatar(user)}
+        )
+        return JsonResponse({
+            'client': user.email,
+            'avatar_url': profile.avatar_url,
+            'language': profile.language,
+        })
+
+    async def put(self, request):
+        user = await _token_user(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        try:
+            data_url = await aavatar_data_url(request)
+        except AvatarError as e:
+            return JsonResponse({'detail': str(e)}, status=e.status_code)
+        if not data_url:
+            return JsonResponse({'detail': 'No file uploaded under field "avatar".'}, status=400)
+
+        # one UPDATE; only fall back to INSERT for users that predate profiles
+        updated = await UserProfile.objects.filter(user=user).aupdate(avatar_url=data_url)
+        if not updated:
+            await sync_to_async(UserProfile.objects.ensure)(user, avatar_url=data_url)
+        return JsonResponse({'avatar_url': data_url})
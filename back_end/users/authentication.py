@@ -0,0 +1,114 @@
+#back_end/users/authentication.py
+"""
+Token authentication with an in-process LRU+TTL cache in front of the token table.
+
+Used by DRF (REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES']), the async views and the
+WebSocket consumer, so /me/ polls and reconnects don't each cost a DB round trip.
+Entries hold only the Token and its User (about a kilobyte each); profiles, with their
+possibly large avatar data URLs, are never cached here.
+
+The cache is per process: Log_out and bans invalidate it only in the worker that
+handled them. Another worker keeps accepting a logged-out or deleted user's token
+until its entry expires, so TOKEN_CACHE_TTL is kept short.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class _TokenCache:
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()   # key -> (expires_at, token)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None:
+                return None
+            expires_at, token = hit
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return token
+
+    def put(self, token):
+        with self._lock:
+            self._items[token.key] = (time.monotonic() + self.ttl, token)
+            self._items.move_to_end(token.key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            stale = [k for k, (_expires, t) in self._items.items() if t.user_id == user_id]
+            for k in stale:
+                del self._items[k]
+
+
+token_cache = _TokenCache(
+    maxsize=getattr(settings, 'TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 10),
+)
+
+
+def _token_query():
+    return Token.objects.select_related('user')
+
+
+def get_token(key):
+    """
+    Token (with its user) for `key`; raises Token.DoesNotExist.
+    """
+    token = token_cache.get(key)
+    if token is None:
+        token = _token_query().get(key=key)
+        token_cache.put(token)
+    return token
+
+
+async def aget_token(key):
+    """
+    Async get_token(): cache hits don't leave the event loop.
+    """
+    token = token_cache.get(key)
+    if token is None:
+        token = await _token_query().aget(key=key)
+        token_cache.put(token)
+    return token
+
+
+def invalidate_token(key):
+    token_cache.invalidate(key)
+
+
+def invalidate_user(user_id):
+    token_cache.invalidate_user(user_id)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        try:
+            token = get_token(key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
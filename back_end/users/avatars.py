@@ -0,0 +1,254 @@
+#back_end/users/avatars.py
+"""
+Avatar upload pipeline: capped, chunked, sniffed, and resized off the request thread.
+
+- Requests whose Content-Length is already far over AVATAR_MAX_BYTES are rejected
+  before the multipart body is parsed.
+- Otherwise CappedUploadHandler (FILE_UPLOAD_HANDLERS) stops keeping a file once it
+  passes AVATAR_MAX_BYTES, so the rest of it is read and dropped, not stored. (Under
+  ASGI the server has already received the body and spooled it to a temp file before
+  the view runs; the cap bounds what we keep and decode, not what the client sends.)
+- Accepted uploads are checked by magic bytes, then decoded and resized to a fixed
+  AVATAR_SIZE square PNG in a process pool. Only that small PNG is base64-encoded, so
+  memory per upload doesn't depend on what the client sent.
+"""
+import asyncio
+import base64
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http import HttpRequest
+from django.http.multipartparser import MultiPartParserError
+
+CHUNK_SIZE = 64 * 1024
+# room for the other multipart fields and part headers on top of the avatar itself
+MULTIPART_OVERHEAD = 64 * 1024
+RESIZE_TIMEOUT = 30  # seconds
+
+# magic prefix -> Pillow format name
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+
+_executor = None
+
+
+class AvatarError(Exception):
+    status_code = 400
+
+
+class AvatarTooLarge(AvatarError):
+    status_code = 413
+
+
+def _max_bytes():
+    return getattr(settings, 'AVATAR_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def sniff(head):
+    """
+    Image format from the first bytes of a file, or None if it isn't one we accept.
+    """
+    for magic, fmt in _SIGNATURES:
+        if head.startswith(magic):
+            return fmt
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+class CappedUploadHandler(FileUploadHandler):
+    """
+    First in the upload handler chain: passes chunks through until a file exceeds
+    AVATAR_MAX_BYTES, then skips the rest of it and records the field name on
+    request.oversized_uploads.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > _max_bytes():
+            oversized = getattr(self.request, 'oversized_uploads', set())
+            oversized.add(self.field_name)
+            self.request.oversized_uploads = oversized
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def _spool(uploaded):
+    """
+    Check size/type and return (path, is_temp) for the worker process to read.
+    Disk-backed uploads are used in place; in-memory ones are copied out chunk by chunk.
+    """
+    if uploaded.size is not None and uploaded.size > _max_bytes():
+        raise AvatarTooLarge('Avatar is too large.')
+
+    uploaded.seek(0)
+    if sniff(uploaded.read(12)) is None:
+        raise AvatarError('Avatar must be a PNG, JPEG, GIF or WebP image.')
+    uploaded.seek(0)
+
+    if hasattr(uploaded, 'temporary_file_path'):
+        return uploaded.temporary_file_path(), False
+
+    total = 0
+    with tempfile.NamedTemporaryFile(suffix='.avatar', delete=False) as tmp:
+        try:
+            for chunk in uploaded.chunks(CHUNK_SIZE):
+                total += len(chunk)
+                if total > _max_bytes():
+                    raise AvatarTooLarge('Avatar is too large.')
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    return tmp.name, True
+
+
+def _resize(path, size, max_pixels):
+    """
+    Runs in a worker process: decode, square-crop and resize to a `size` x `size` PNG.
+    """
+    from PIL import Image, ImageOps
+
+    # Pillow only warns between 1x and 2x MAX_IMAGE_PIXELS, so check the header size ourselves
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(path) as img:
+        if img.format not in ('PNG', 'JPEG', 'GIF', 'WEBP'):
+            raise ValueError(f"unsupported format {img.format}")
+        if img.width * img.height > max_pixels:
+            raise ValueError(f"image too large ({img.width}x{img.height})")
+        img.draft('RGB', (size, size))  # JPEG: decode at a reduced scale
+        img = ImageOps.exif_transpose(img).convert('RGBA')
+        img = ImageOps.fit(img, (size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, 'PNG', optimize=True)
+        return out.getvalue()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        # never fork the ASGI worker itself: it has an event loop and several thread pools
+        _executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'AVATAR_WORKERS', 2),
+            mp_context=multiprocessing.get_context('forkserver'),
+        )
+    return _executor
+
+
+def _resize_args(path):
+    return (
+        path,
+        getattr(settings, 'AVATAR_SIZE', 128),
+        getattr(settings, 'AVATAR_MAX_PIXELS', 40_000_000),
+    )
+
+
+def _to_data_url(png):
+    return "data:image/png;base64," + base64.b64encode(png).decode('ascii')
+
+
+def _files(request):
+    """
+    request.FILES for any method. DRF's Request parses multipart bodies on PUT, but a
+    plain Django request (the async views) only does so on POST.
+    """
+    if (isinstance(request, HttpRequest) and request.method != 'POST'
+            and request.content_type == 'multipart/form-data' and not request._read_started):
+        try:
+            request._post, request._files = request.parse_file_upload(request.META, request)
+        except MultiPartParserError:
+            raise AvatarError('Malformed upload.')
+    return request.FILES
+
+
+def _uploaded_file(request, field):
+    """
+    request.FILES[field] or None, raising AvatarTooLarge if the upload was over the cap.
+    Reading FILES first matters: it is what runs CappedUploadHandler.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > _max_bytes() + MULTIPART_OVERHEAD:
+        raise AvatarTooLarge('Avatar is too large.')
+
+    uploaded = _files(request).get(field)
+    if field in getattr(request, 'oversized_uploads', ()):
+        raise AvatarTooLarge('Avatar is too large.')
+    return uploaded
+
+
+def _accept(request, field):
+    """
+    Parse the upload and spool it for the worker: (path, is_temp), or None if no file was sent.
+    """
+    uploaded = _uploaded_file(request, field)
+    if not uploaded:
+        return None
+    return _spool(uploaded)
+
+
+def avatar_data_url(request, field='avatar'):
+    """
+    Processed avatar from `request.FILES[field]` as a PNG data URL; None if no file was sent.
+    Raises AvatarError (with a status_code) if the upload is rejected.
+    """
+    spooled = _accept(request, field)
+    if spooled is None:
+        return None
+
+    path, is_temp = spooled
+    global _executor
+    try:
+        png = _pool().submit(_resize, *_resize_args(path)).result(timeout=RESIZE_TIMEOUT)
+    except BrokenProcessPool:
+        _executor = None
+        raise AvatarError('Unable to process avatar image.')
+    except Exception:
+        raise AvatarError('Unable to process avatar image.')
+    finally:
+        if is_temp:
+            os.unlink(path)
+    return _to_data_url(png)
+
+
+async def aavatar_data_url(request, field='avatar'):
+    """
+    Async avatar_data_url() for users/async_views.py. The multipart parse (upload
+    handlers, temp-file writes) and spooling happen in one thread hop, off the event loop.
+    """
+    spooled = await sync_to_async(_accept, thread_sensitive=False)(request, field)
+    if spooled is None:
+        return None
+
+    path, is_temp = spooled
+    global _executor
+    try:
+        loop = asyncio.get_running_loop()
+        png = await asyncio.wait_for(
+            loop.run_in_executor(_pool(), _resize, *_resize_args(path)), RESIZE_TIMEOUT
+        )
+    except BrokenProcessPool:
+        _executor = None
+        raise AvatarError('Unable to process avatar image.')
+    except Exception:
+        raise AvatarError('Unable to process avatar image.')
+    finally:
+        if is_temp:
+            os.unlink(path)
+    return _to_data_url(png)
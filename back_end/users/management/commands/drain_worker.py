@@ -0,0 +1,22 @@
+#back_end/users/management/commands/drain_worker.py
+import os
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Put a running ASGI worker into drain mode before restarting it (see chatter_box/handoff.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('pid', type=int, help="PID of the daphne/uvicorn worker to drain")
+
+    def handle(self, *args, **options):
+        pid = options['pid']
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            raise CommandError(f"No process with pid {pid}")
+        except PermissionError:
+            raise CommandError(f"Not allowed to signal pid {pid}")
+        self.stdout.write(self.style.SUCCESS(f"Drain requested for worker {pid}"))
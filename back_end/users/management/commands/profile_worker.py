@@ -0,0 +1,25 @@
+#back_end/users/management/commands/profile_worker.py
+import os
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Start or stop the sampling profiler in a running ASGI worker (see chatter_box/tracing.py). "
+        "Run once to start, again to stop and write the profile to PROFILE_OUTPUT_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('pid', type=int, help="PID of the daphne/uvicorn worker to profile")
+
+    def handle(self, *args, **options):
+        pid = options['pid']
+        try:
+            os.kill(pid, signal.SIGUSR2)
+        except ProcessLookupError:
+            raise CommandError(f"No process with pid {pid}")
+        except PermissionError:
+            raise CommandError(f"Not allowed to signal pid {pid}")
+        self.stdout.write(self.style.SUCCESS(f"Profiler toggled in worker {pid}"))
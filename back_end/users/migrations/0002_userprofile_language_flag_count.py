@@ -0,0 +1,71 @@
+# Folds the Language and UserFlag side tables into UserProfile.
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def _default_avatar(user_id):
+    return f"https://robohash.org/{user_id}.png?size=80x80&set=set1"
+
+
+def copy_side_tables(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Language = apps.get_model('users', 'Language')
+    UserFlag = apps.get_model('users', 'UserFlag')
+
+    # users that have a language/flag row but never got a profile
+    have_profile = UserProfile.objects.values('user_id')
+    missing = (
+        set(Language.objects.exclude(user_id__in=have_profile).values_list('user_id', flat=True))
+        | set(UserFlag.objects.exclude(user_id__in=have_profile).values_list('user_id', flat=True))
+    )
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=uid, avatar_url=_default_avatar(uid)) for uid in missing],
+        batch_size=1000,
+    )
+
+    UserProfile.objects.filter(user_id__in=Language.objects.values('user_id')).update(
+        language=Subquery(Language.objects.filter(user_id=OuterRef('user_id')).values('code')[:1])
+    )
+    UserProfile.objects.filter(user_id__in=UserFlag.objects.values('user_id')).update(
+        flag_count=Subquery(UserFlag.objects.filter(user_id=OuterRef('user_id')).values('count')[:1])
+    )
+
+
+def restore_side_tables(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Language = apps.get_model('users', 'Language')
+    UserFlag = apps.get_model('users', 'UserFlag')
+
+    rows = UserProfile.objects.values_list('user_id', 'language', 'flag_count')
+    Language.objects.bulk_create(
+        [Language(user_id=uid, code=code) for uid, code, _ in rows.iterator()],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    UserFlag.objects.bulk_create(
+        [UserFlag(user_id=uid, count=count) for uid, _, count in rows.iterator()],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='language',
+            field=models.CharField(default='en', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='flag_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(copy_side_tables, restore_side_tables),
+    ]
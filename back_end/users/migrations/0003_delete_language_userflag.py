@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_userprofile_language_flag_count'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Language',
+        ),
+        migrations.DeleteModel(
+            name='UserFlag',
+        ),
+    ]
@@ -3,8 +3,41 @@ from django.db import models
 # Create your models here.
 #back_end/users/models.py
 from django.db import models
+from django.db.models import F
 from django.conf import settings
 
+def _default_avatar(user):
+    # stable robohash based on user id
+    return f"https://robohash.org/{user.pk}.png?size=80x80&set=set1"
+
+
+class UserProfileManager(models.Manager):
+    """
+    One-row accessors for the per-user profile (avatar, language, flag count).
+    """
+
+    def for_user(self, user):
+        # by id, so the profile isn't attached to (and kept alive by) a cached user object
+        profile, _ = self.get_or_create(user_id=user.pk, defaults={'avatar_url': _default_avatar(user)})
+        return profile
+
+    def ensure(self, user, avatar_url=None, language='en'):
+        # single INSERT ... ON CONFLICT DO NOTHING; existing profiles are left untouched
+        self.bulk_create(
+            [self.model(user=user, avatar_url=avatar_url or _default_avatar(user), language=language)],
+            ignore_conflicts=True,
+        )
+
+    def add_flag(self, user):
+        """
+        Atomically bump the user's flag count and return the new value.
+        """
+        if not self.filter(user=user).update(flag_count=F('flag_count') + 1):
+            self.create(user=user, avatar_url=_default_avatar(user), flag_count=1)
+            return 1
+        return self.filter(user=user).values_list('flag_count', flat=True).get()
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -13,23 +46,14 @@ class UserProfile(models.Model):
     )
     # Use TextField for potentially large data URLs
     avatar_url = models.TextField(blank=True)
+    language = models.CharField(max_length=10, default='en')  # e.g., 'en', 'es', 'fr', 'de', 'ja', 'zh-cn'
+    flag_count = models.PositiveIntegerField(default=0)
 
-    def __str__(self):
-        email = getattr(self.user, "email", None) or getattr(self.user, "username", "user")
-        return f"Profile({email})"
-
-
-class UserFlag(models.Model):
-    user = models.OneToOneField(
-        settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
-        related_name='flags'
-    )
-    count = models.PositiveIntegerField(default=0)
+    objects = UserProfileManager()
 
     def __str__(self):
         email = getattr(self.user, "email", None) or getattr(self.user, "username", "user")
-        return f"Flags({email}={self.count})"
+        return f"Profile({email}, lang={self.language}, flags={self.flag_count})"
 
 
 class BannedAccount(models.Model):
@@ -38,15 +62,3 @@ class BannedAccount(models.Model):
     def __str__(self):
         return f"Banned({self.email})"
 
-
-class Language(models.Model):
-    user = models.OneToOneField(
-        settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
-        related_name='language_pref'
-    )
-    code = models.CharField(max_length=10, default='en')  # e.g., 'en', 'es', 'fr', 'de', 'ja', 'zh-cn'
-
-    def __str__(self):
-        email = getattr(self.user, "email", None) or getattr(self.user, "username", "user")
-        return f"Language({email}={self.code})"
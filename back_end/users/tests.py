@@ -1,3 +1,270 @@
-from django.test import TestCase
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import SkipFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_login_failed
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from .authentication import _TokenCache
+from .avatars import CappedUploadHandler, _resize, sniff
+from .models import UserProfile
 
 # Create your tests here.
+
+User = get_user_model()
+
+
+# Login runs authenticate() on a pool thread with its own DB connection, so the user
+# must be committed rather than live in a TestCase transaction.
+class AsyncLoginTests(TransactionTestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='a@x.io', email='a@x.io', password='pw-12345!')
+
+    async def test_login_returns_token(self):
+        res = await self.async_client.post(
+            '/chatterbox/v1/async/login/', {'email': 'a@x.io', 'password': 'pw-12345!'},
+            content_type='application/json',
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['client'], 'a@x.io')
+        self.assertTrue(res.json()['token'])
+
+    async def test_bad_password_goes_through_authenticate(self):
+        failures = []
+
+        def on_failure(sender, credentials, **kwargs):
+            failures.append(credentials['username'])
+
+        user_login_failed.connect(on_failure)
+        self.addCleanup(user_login_failed.disconnect, on_failure)
+
+        res = await self.async_client.post(
+            '/chatterbox/v1/async/login/', {'email': 'a@x.io', 'password': 'wrong'},
+            content_type='application/json',
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(failures, ['a@x.io'])
+
+
+class ConsolidateProfileMigrationTests(TransactionTestCase):
+    migrate_from = [('users', '0001_initial')]
+    migrate_to = [('users', '0002_userprofile_language_flag_count')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        OldUser = old_apps.get_model('auth', 'User')
+        OldProfile = old_apps.get_model('users', 'UserProfile')
+        OldLanguage = old_apps.get_model('users', 'Language')
+        OldFlag = old_apps.get_model('users', 'UserFlag')
+
+        self.full = OldUser.objects.create(username='full@x.io')
+        OldProfile.objects.create(user=self.full, avatar_url='data:image/png;base64,AAAA')
+        OldLanguage.objects.create(user=self.full, code='fr')
+        OldFlag.objects.create(user=self.full, count=2)
+
+        self.no_profile = OldUser.objects.create(username='noprofile@x.io')
+        OldLanguage.objects.create(user=self.no_profile, code='es')
+
+        self.bare = OldUser.objects.create(username='bare@x.io')
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_side_tables_are_copied_into_profile(self):
+        Profile = self.apps.get_model('users', 'UserProfile')
+
+        full = Profile.objects.get(user_id=self.full.pk)
+        self.assertEqual((full.avatar_url, full.language, full.flag_count), ('data:image/png;base64,AAAA', 'fr', 2))
+
+        created = Profile.objects.get(user_id=self.no_profile.pk)
+        self.assertEqual((created.language, created.flag_count), ('es', 0))
+        self.assertIn(f"robohash.org/{self.no_profile.pk}.png", created.avatar_url)
+
+        self.assertFalse(Profile.objects.filter(user_id=self.bare.pk).exists())
+
+
+class UserProfileManagerTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='a@x.io', email='a@x.io', password='pw')
+
+    def test_add_flag_creates_and_increments(self):
+        self.assertEqual(UserProfile.objects.add_flag(self.user), 1)
+        self.assertEqual(UserProfile.objects.add_flag(self.user), 2)
+        self.assertEqual(UserProfile.objects.get(user=self.user).flag_count, 2)
+
+    def test_ensure_keeps_existing_profile(self):
+        UserProfile.objects.create(user=self.user, avatar_url='mine', language='de')
+        UserProfile.objects.ensure(self.user)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.avatar_url, profile.language), ('mine', 'de'))
+
+
+def _fake_token(key, user_id):
+    return SimpleNamespace(key=key, user_id=user_id)
+
+
+class TokenCacheTests(SimpleTestCase):
+
+    def test_hit_and_miss(self):
+        cache = _TokenCache(maxsize=10, ttl=60)
+        token = _fake_token('k1', 1)
+        cache.put(token)
+        self.assertIs(cache.get('k1'), token)
+        self.assertIsNone(cache.get('nope'))
+
+    def test_evicts_least_recently_used(self):
+        cache = _TokenCache(maxsize=2, ttl=60)
+        cache.put(_fake_token('a', 1))
+        cache.put(_fake_token('b', 2))
+        cache.get('a')                      # 'b' is now the oldest
+        cache.put(_fake_token('c', 3))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_entries_expire(self):
+        cache = _TokenCache(maxsize=10, ttl=5)
+        with mock.patch('users.authentication.time.monotonic', return_value=100.0):
+            cache.put(_fake_token('a', 1))
+        with mock.patch('users.authentication.time.monotonic', return_value=104.0):
+            self.assertIsNotNone(cache.get('a'))
+        with mock.patch('users.authentication.time.monotonic', return_value=106.0):
+            self.assertIsNone(cache.get('a'))
+
+    def test_invalidate_token_and_user(self):
+        cache = _TokenCache(maxsize=10, ttl=60)
+        cache.put(_fake_token('a', 1))
+        cache.put(_fake_token('b', 1))
+        cache.put(_fake_token('c', 2))
+
+        cache.invalidate('c')
+        self.assertIsNone(cache.get('c'))
+
+        cache.invalidate_user(1)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+
+
+class LogOutInvalidatesCacheTests(TestCase):
+
+    def test_logged_out_token_is_rejected(self):
+        from rest_framework.authtoken.models import Token
+
+        user = User.objects.create_user(username='a@x.io', email='a@x.io', password='pw')
+        token = Token.objects.create(user=user)
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+        self.assertEqual(self.client.get('/chatterbox/v1/me/', **auth).status_code, 200)  # now cached
+        self.assertEqual(self.client.post('/chatterbox/v1/logout/', **auth).status_code, 204)
+        self.assertEqual(self.client.get('/chatterbox/v1/me/', **auth).status_code, 401)
+
+
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+
+
+class AvatarSniffTests(SimpleTestCase):
+
+    def test_known_formats(self):
+        self.assertEqual(sniff(PNG_MAGIC + b'....'), 'PNG')
+        self.assertEqual(sniff(b'\xff\xd8\xff\xe0'), 'JPEG')
+        self.assertEqual(sniff(b'GIF89a'), 'GIF')
+        self.assertEqual(sniff(b'RIFF\x00\x00\x00\x00WEBP'), 'WEBP')
+
+    def test_rejects_other_content(self):
+        self.assertIsNone(sniff(b'<svg xmlns='))
+        self.assertIsNone(sniff(b''))
+
+
+class ResizePixelCapTests(SimpleTestCase):
+
+    def _png(self, width, height):
+        from PIL import Image
+
+        tmp = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
+        self.addCleanup(os.unlink, tmp.name)
+        with tmp:
+            Image.new('RGB', (width, height)).save(tmp, 'PNG')
+        return tmp.name
+
+    def test_resizes_within_cap(self):
+        self.assertTrue(_resize(self._png(10, 10), 8, max_pixels=100).startswith(PNG_MAGIC))
+
+    def test_rejects_image_just_over_cap(self):
+        # Pillow itself would only warn here (it raises above 2x MAX_IMAGE_PIXELS)
+        with self.assertRaises(ValueError):
+            _resize(self._png(11, 10), 8, max_pixels=100)
+
+
+@override_settings(AVATAR_MAX_BYTES=150)
+class CappedUploadHandlerTests(SimpleTestCase):
+
+    def test_skips_file_past_cap_and_records_field(self):
+        request = SimpleNamespace()
+        handler = CappedUploadHandler(request)
+        handler.new_file('avatar', 'a.png', 'image/png', None)
+
+        self.assertEqual(handler.receive_data_chunk(b'x' * 100, 0), b'x' * 100)
+        with self.assertRaises(SkipFile):
+            handler.receive_data_chunk(b'x' * 100, 100)
+        self.assertEqual(request.oversized_uploads, {'avatar'})
+
+
+@override_settings(AVATAR_MAX_BYTES=1024)
+class OversizedAvatarTests(TestCase):
+
+    def setUp(self):
+        from rest_framework.authtoken.models import Token
+
+        user = User.objects.create_user(username='a@x.io', email='a@x.io', password='pw')
+        self.key = Token.objects.create(user=user).key
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {self.key}'}
+
+    def _body(self, size):
+        avatar = SimpleUploadedFile('a.png', PNG_MAGIC + b'0' * size, content_type='image/png')
+        return encode_multipart(BOUNDARY, {'avatar': avatar})
+
+    def test_me_put_over_cap_is_413(self):
+        # small enough to pass the Content-Length check, so CappedUploadHandler rejects it
+        res = self.client.put('/chatterbox/v1/me/', self._body(4096), content_type=MULTIPART_CONTENT, **self.auth)
+        self.assertEqual(res.status_code, 413)
+
+    async def test_async_me_put_over_cap_is_413(self):
+        # AsyncClient treats extra kwargs as ASGI scope keys, not META; pass the header explicitly
+        res = await self.async_client.put(
+            '/chatterbox/v1/async/me/', self._body(4096), content_type=MULTIPART_CONTENT,
+            headers={'Authorization': f'Token {self.key}'},
+        )
+        self.assertEqual(res.status_code, 413)
+
+    def test_content_length_far_over_cap_is_413(self):
+        res = self.client.put('/chatterbox/v1/me/', self._body(200 * 1024), content_type=MULTIPART_CONTENT, **self.auth)
+        self.assertEqual(res.status_code, 413)
+
+    def test_me_put_without_file_is_400(self):
+        res = self.client.put(
+            '/chatterbox/v1/me/', encode_multipart(BOUNDARY, {}), content_type=MULTIPART_CONTENT, **self.auth
+        )
+        self.assertEqual(res.status_code, 400)
+
+    async def test_async_me_put_without_file_is_400(self):
+        res = await self.async_client.put(
+            '/chatterbox/v1/async/me/', encode_multipart(BOUNDARY, {}), content_type=MULTIPART_CONTENT,
+            headers={'Authorization': f'Token {self.key}'},
+        )
+        self.assertEqual(res.status_code, 400)
@@ -1,10 +1,16 @@
 #back_end/users/urls.py
 from django.urls import path
-from .views import Log_in, Log_out , Sign_up, Me  # ⬅️ added Me
+from .views import Log_in, Log_out , Sign_up, Me, Stats
+from .async_views import Log_in_async, Sign_up_async, Me_async
 
 urlpatterns = [
     path('login/', Log_in.as_view()), 
     path('logout/', Log_out.as_view()), 
     path('signup/', Sign_up.as_view()),
     path('me/', Me.as_view()),  
+    path('stats/', Stats.as_view()),
+    # async-native equivalents for ASGI deployments (same request/response shapes)
+    path('async/login/', Log_in_async.as_view()),
+    path('async/signup/', Sign_up_async.as_view()),
+    path('async/me/', Me_async.as_view()),
 ]
\ No newline at end of file
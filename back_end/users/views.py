@@ -8,28 +8,13 @@ from rest_framework.authtoken.models import Token
 from django.db import connection 
 from django.core.management.color import no_style 
 from rest_framework.parsers import MultiPartParser, FormParser  # ⬅️ for file uploads
-from .models import UserProfile, UserFlag, BannedAccount, Language
-
-import base64
+from .models import UserProfile, BannedAccount, _default_avatar
+from .authentication import invalidate_token
+from .avatars import AvatarError, avatar_data_url
+from chatter_box import presence
 
 User = get_user_model()
 
-def _default_avatar(user):
-    # stable robohash based on user id
-    return f"https://robohash.org/{user.pk}.png?size=80x80&set=set1"
-
-def _file_to_data_url(django_file):
-    """
-    Convert an uploaded file to a data URL so we don't need MEDIA settings.
-    """
-    if not django_file:
-        return None
-    content = django_file.read()
-    # fallback if content_type missing
-    content_type = getattr(django_file, "content_type", None) or "image/png"
-    b64 = base64.b64encode(content).decode("ascii")
-    return f"data:{content_type};base64,{b64}"
-
 
 class Log_in(APIView): 
     permission_classes = [AllowAny]
@@ -47,9 +32,7 @@ class Log_in(APIView):
         
         token, _ = Token.objects.get_or_create(user=user)
         # ensure profile exists
-        profile, _ = UserProfile.objects.get_or_create(user=user, defaults={'avatar_url': _default_avatar(user)})
-        # ensure language exists
-        Language.objects.get_or_create(user=user, defaults={'code': 'en'})
+        UserProfile.objects.ensure(user)
 
         return Response(
             {'client': user.email, 'token': token.key}
@@ -60,6 +43,7 @@ class Log_out(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request): 
+        invalidate_token(request.user.auth_token.key)
         request.user.auth_token.delete()
         return Response(
             {"message": "User Successfully Logged Out."},
@@ -84,21 +68,23 @@ class Sign_up(APIView):
         if BannedAccount.objects.filter(email__iexact=email).exists():
             return Response({'detail': 'This email is banned.'}, status=status.HTTP_403_FORBIDDEN)
 
+        # validate the avatar upload before creating anything
+        try:
+            avatar_url = avatar_data_url(request)
+        except AvatarError as e:
+            return Response({'detail': str(e)}, status=e.status_code)
+
         user = User.objects.create_user(username=email, email=email, password=password)
         
         # create token
         token = Token.objects.create(user=user)
 
         # avatar: file upload first, else optional URL, else default robohash
-        uploaded = request.FILES.get('avatar')
-        avatar_url = _file_to_data_url(uploaded)
         if not avatar_url:
             maybe_url = request.data.get('avatar_url')
             avatar_url = maybe_url if maybe_url else _default_avatar(user)
 
-        UserProfile.objects.create(user=user, avatar_url=avatar_url)
-        Language.objects.create(user=user, code=language_code)
-        UserFlag.objects.get_or_create(user=user, defaults={'count': 0})
+        UserProfile.objects.create(user=user, avatar_url=avatar_url, language=language_code)
 
         return Response(
             {'client': user.email, 'token': token.key}, 
@@ -115,33 +101,36 @@ class Me(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
     def get(self, request):
-        profile, _ = UserProfile.objects.get_or_create(
-            user=request.user,
-            defaults={'avatar_url': _default_avatar(request.user)}
-        )
-        lang, _ = Language.objects.get_or_create(user=request.user, defaults={'code': 'en'})
+        profile = UserProfile.objects.for_user(request.user)
         return Response({
             'client': request.user.email,
             'avatar_url': profile.avatar_url,
-            'language': lang.code,
+            'language': profile.language,
         })
 
     def put(self, request):
         """
         Update avatar via multipart upload (field name: 'avatar').
         """
-        profile, _ = UserProfile.objects.get_or_create(
-            user=request.user,
-            defaults={'avatar_url': _default_avatar(request.user)}
-        )
-        uploaded = request.FILES.get('avatar')
-        if not uploaded:
-            return Response({'detail': 'No file uploaded under field "avatar".'}, status=status.HTTP_400_BAD_REQUEST)
-
-        data_url = _file_to_data_url(uploaded)
+        profile = UserProfile.objects.for_user(request.user)
+        try:
+            data_url = avatar_data_url(request)
+        except AvatarError as e:
+            return Response({'detail': str(e)}, status=e.status_code)
         if not data_url:
-            return Response({'detail': 'Unable to read uploaded file.'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'detail': 'No file uploaded under field "avatar".'}, status=status.HTTP_400_BAD_REQUEST)
 
         profile.avatar_url = data_url
-        profile.save()
-        return Response({'avatar_url': profile.avatar_url})
\ No newline at end of file
+        profile.save(update_fields=['avatar_url'])
+        return Response({'avatar_url': profile.avatar_url})
+
+
+class Stats(APIView):
+    """
+    Waiting / paired counts and expected wait per language, summed across workers.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        return Response(presence.stats())
@@ -3,6 +3,18 @@ import React, { useState, useEffect, useRef } from "react";
 import axios from "axios";
 import { useNavigate } from "react-router-dom";
 
+// after a server drain: how many times to retry, and the longest wait between tries
+const MAX_RECONNECT_ATTEMPTS = 8;
+const MAX_RECONNECT_DELAY_MS = 30000;
+
+// first retry uses the server's (already jittered) delay; later ones back off
+// exponentially with jitter so refused clients don't retry in lockstep
+const reconnectDelay = (baseMs, attempt) => {
+  if (attempt === 0) return baseMs;
+  const ceiling = Math.min(baseMs * 2 ** attempt, MAX_RECONNECT_DELAY_MS);
+  return ceiling / 2 + Math.random() * (ceiling / 2);
+};
+
 export default function ChatRoom() {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState("");
@@ -10,6 +22,7 @@ export default function ChatRoom() {
   const [waiting, setWaiting] = useState(false);
   const [showModal, setShowModal] = useState(false);
   const [newAvatarFile, setNewAvatarFile] = useState(null);
+  const [queueInfo, setQueueInfo] = useState(null);
 
   const socketRef = useRef(null);
   const messagesEndRef = useRef(null);
@@ -45,49 +58,93 @@ export default function ChatRoom() {
 
     const protocol = window.location.protocol === "https:" ? "wss" : "ws";
     const WS_BASE = import.meta.env.VITE_WS_BASE;
-    const wsUrl = WS_BASE.startsWith("ws")
+    const baseUrl = WS_BASE.startsWith("ws")
       ? `${WS_BASE}/socket-server/?token=${token}`
       : `${protocol}://${window.location.host}${WS_BASE}/socket-server/?token=${token}`;
 
-    const socket = new WebSocket(wsUrl);
-    socketRef.current = socket;
+    let closedByUs = false;
+    let reconnectTimer = null;
+    // set when the server drains: { baseMs, resume, attempt }; kept until a socket opens
+    let retry = null;
 
-    socket.onopen = () => console.log("WebSocket connected");
+    const connect = (resumeToken) => {
+      const wsUrl = resumeToken ? `${baseUrl}&resume=${encodeURIComponent(resumeToken)}` : baseUrl;
+      const socket = new WebSocket(wsUrl);
+      socketRef.current = socket;
 
-    socket.onmessage = (e) => {
-      try {
-        const data = JSON.parse(e.data);
+      socket.onopen = () => {
+        console.log("WebSocket connected");
+        retry = null; // the resume token (if any) was redeemed by this handshake
+      };
+
+      socket.onmessage = (e) => {
+        try {
+          const data = JSON.parse(e.data);
+
+          // periodic queue stats while waiting (only sent if the server enables them)
+          if (data.queue) {
+            setQueueInfo(data.queue);
+            return;
+          }
+
+          // server is restarting: reconnect later, resuming the same partner
+          if (data.status === "reconnect") {
+            retry = { baseMs: data.retry_after_ms ?? 1000, resume: data.resume_token, attempt: 0 };
+            return;
+          }
+
+          if (data.status) {
+            // waiting/paired status
+            setWaiting(data.status === "waiting");
+            if (data.message) {
+              setMessages((prev) => [...prev, { author: "System", text: data.message }]);
+            }
+            return;
+          }
 
-        if (data.status) {
-          // waiting/paired status
-          setWaiting(data.status === "waiting");
-          if (data.message) {
+          // broadcast payload from server
+          if (data.author && data.message) {
+            setMessages((prev) => [
+              ...prev,
+              { author: data.author, text: data.message, avatar: data.avatar || null },
+            ]);
+            return;
+          }
+
+          // system message (welcome, etc.)
+          if (data.message && !data.author) {
             setMessages((prev) => [...prev, { author: "System", text: data.message }]);
           }
-          return;
+        } catch (err) {
+          console.error("Bad WS payload:", err);
         }
+      };
 
-        // broadcast payload from server
-        if (data.author && data.message) {
+      // also fires when a handshake is refused (e.g. we reached the draining worker again)
+      socket.onclose = () => {
+        console.log("WebSocket closed");
+        if (closedByUs || !retry) return;
+        if (retry.attempt >= MAX_RECONNECT_ATTEMPTS) {
+          retry = null;
           setMessages((prev) => [
             ...prev,
-            { author: data.author, text: data.message, avatar: data.avatar || null },
+            { author: "System", text: "Lost connection to the server. Please refresh the page." },
           ]);
           return;
         }
-
-        // system message (welcome, etc.)
-        if (data.message && !data.author) {
-          setMessages((prev) => [...prev, { author: "System", text: data.message }]);
-        }
-      } catch (err) {
-        console.error("Bad WS payload:", err);
-      }
+        const delay = reconnectDelay(retry.baseMs, retry.attempt);
+        retry.attempt += 1;
+        reconnectTimer = setTimeout(() => connect(retry?.resume), delay);
+      };
     };
 
-    socket.onclose = () => console.log("WebSocket closed");
+    connect(null);
 
-    return () => socket.close();
+    return () => {
+      closedByUs = true;
+      clearTimeout(reconnectTimer);
+      socketRef.current?.close();
+    };
   }, [token]);
 
   useEffect(() => {
@@ -184,6 +241,11 @@ export default function ChatRoom() {
           <div className="absolute inset-0 bg-black/50 backdrop-blur-sm flex flex-col items-center justify-center gap-2">
             <div className="h-10 w-10 border-4 border-emerald-400/60 border-t-transparent rounded-full animate-spin" />
             <div className="text-slate-300">We are searching for a chat partner…</div>
+            {queueInfo && (
+              <div className="text-[12px] text-slate-400">
+                {queueInfo.waiting} waiting · {queueInfo.paired} chatting
+              </div>
+            )}
           </div>
         )}
 